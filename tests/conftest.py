@@ -0,0 +1,178 @@
+"""Shared pytest fixtures."""
+
+import itertools
+
+import grpc
+import pytest
+
+import python_pachyderm
+from python_pachyderm.service import Service
+from tests import grpc_replay, util
+
+pytest_plugins = ["tests.grpc_replay"]
+
+
+class ChannelPool:
+    """
+    A stand-in for a `grpc.Channel` that round-robins calls across several
+    underlying channels, so bursts of calls don't queue up behind a single
+    HTTP/2 connection. Each call stays on one channel, so streaming calls
+    like `PutFile` aren't split across connections.
+    """
+
+    def __init__(self, channels):
+        self._channels = channels
+        self._counter = itertools.count()
+
+    def _multi_callable(self, kind, *args, **kwargs):
+        callables = [getattr(channel, kind)(*args, **kwargs) for channel in self._channels]
+
+        def call(*call_args, **call_kwargs):
+            multi_callable = callables[next(self._counter) % len(callables)]
+            return multi_callable(*call_args, **call_kwargs)
+
+        return call
+
+    def unary_unary(self, *args, **kwargs):
+        return self._multi_callable("unary_unary", *args, **kwargs)
+
+    def unary_stream(self, *args, **kwargs):
+        return self._multi_callable("unary_stream", *args, **kwargs)
+
+    def stream_unary(self, *args, **kwargs):
+        return self._multi_callable("stream_unary", *args, **kwargs)
+
+    def stream_stream(self, *args, **kwargs):
+        return self._multi_callable("stream_stream", *args, **kwargs)
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Blocks until every channel has connected, connecting them all
+        concurrently.
+        """
+        futures = [grpc.channel_ready_future(channel) for channel in self._channels]
+        try:
+            for future in futures:
+                future.result(timeout=timeout)
+        finally:
+            # stop any futures that are still waiting, e.g. after a timeout
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        for channel in self._channels:
+            channel.close()
+
+
+def make_client(pool_size=8):
+    """
+    Creates a client whose services all share a pool of `pool_size` channels.
+    The channels are connected before returning, so the first call made with
+    the client doesn't pay for connection setup. Returns a `(client, pool)`
+    tuple; close the pool once the client is no longer needed.
+    """
+    client = python_pachyderm.Client()
+    options = [
+        # without a local subchannel pool, channels to the same address would
+        # all share one connection
+        ("grpc.use_local_subchannel_pool", 1),
+        # keep connections alive while tests sit idle (e.g. while waiting on
+        # a pipeline to start), so that they aren't dropped by proxies and
+        # have to be re-established
+        ("grpc.keepalive_time_ms", 30000),
+        ("grpc.keepalive_timeout_ms", 10000),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+    pool = ChannelPool([grpc.insecure_channel(client.address, options=options) for _ in range(pool_size)])
+    pool.wait_until_ready(timeout=30)
+    for service in Service:
+        client._stubs[service] = service.stub(pool)
+    return (client, pool)
+
+
+class Sandbox:
+    def __init__(self, client, test_name, input_repo_name, commit, reuse=False):
+        self.client = client
+        self.commit = commit
+        self.input_repo_name = input_repo_name
+        if reuse:
+            self.pipeline_repo_name = util.get_or_create_test_pipeline_from_input(client, test_name, input_repo_name)
+        else:
+            self.pipeline_repo_name = util.create_test_pipeline_from_input(client, test_name, input_repo_name)
+        self.job_info = None
+
+    def wait_for_job(self):
+        if self.job_info is None:
+            self.job_info = util.wait_for_job(self.client, self.commit, pipeline_name=self.pipeline_repo_name)
+        return self.job_info.job.id
+
+    def wait_for_job_start(self):
+        return util.wait_for_job_start(self.client, self.commit, self.pipeline_repo_name)
+
+
+@pytest.fixture(scope="session")
+def pooled_client():
+    """
+    A client shared by every sandbox in the session, so the pool's channels
+    are only created and connected once.
+    """
+    client, pool = make_client()
+    yield client
+    pool.close()
+
+
+@pytest.fixture(scope="session")
+def golden_input(request, pooled_client):
+    """
+    A `(repo name, commit)` tuple for an input repo with a single commit
+    containing `file.dat`. Sandbox pipelines only read their input, so they
+    all share this one, rather than each uploading the same file again.
+    """
+    # each xdist worker gets its own repo, so workers don't race to create it
+    worker_id = getattr(request.config, "workerinput", {}).get("workerid", "master")
+    repo_name = "python-pachyderm-golden-input-{}".format(worker_id)
+    return (repo_name, util.get_or_create_test_input(pooled_client, repo_name))
+
+
+@pytest.fixture(scope="module")
+def sandbox(request, pooled_client, golden_input):
+    """
+    A sandbox shared by every test in a module. Creating a pipeline and
+    waiting for its job dominates test time, so tests that only read from the
+    sandbox should use this fixture.
+    """
+    # module names are dotted (e.g. `tests.test_pps`), but dots aren't valid
+    # in repo names
+    test_name = request.module.__name__.rsplit(".", 1)[-1]
+    # requests only match cached responses if they name the same pipeline,
+    # so with the gRPC response cache enabled, reuse one from previous runs
+    return Sandbox(pooled_client, test_name, *golden_input, reuse=grpc_replay.is_enabled())
+
+
+@pytest.fixture
+def private_sandbox(request, pooled_client, golden_input):
+    """
+    A sandbox for a single test. Use this for tests that stop, delete or
+    otherwise mutate the sandbox's job or pipeline.
+    """
+    return Sandbox(pooled_client, request.node.name, *golden_input)
+
+
+@pytest.fixture
+def baseline_pipeline_count(private_sandbox):
+    """
+    The number of pipelines in the cluster, including the sandbox's, for
+    tests that check how deletions change it.
+    """
+    return len(private_sandbox.client.list_pipeline().pipeline_info)
+
+
+@pytest.fixture
+def baseline_job_count(private_sandbox):
+    """
+    The number of jobs in the cluster once the sandbox's job has been
+    created, for tests that check how deletions change it.
+    """
+    private_sandbox.wait_for_job()
+    return len(list(private_sandbox.client.list_job()))
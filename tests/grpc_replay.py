@@ -0,0 +1,282 @@
+"""
+A pytest plugin that caches gRPC responses to read-only calls made by tests,
+for faster local iteration on tests. Enabled with `--grpc-cache`:
+
+* `off`: The default. Calls always go to the cluster.
+* `record`: Calls go to the cluster, and responses to read-only calls are
+stored in the cache, replacing any previously recorded for the test.
+* `replay`: Read-only calls are served from the cache when possible, and go
+to the cluster otherwise. Nothing is stored.
+
+Only calls made from a test's body are cached, so fixtures (e.g. creating
+sandboxes or the shared input repo) always go to the cluster. Responses are
+keyed on the test, the method name and the serialized request, so requests
+only match across runs if they name the same repos and pipelines. Once a test
+makes a call that writes to the cluster, its later reads may depend on the
+write, so the cache isn't used for the rest of that test.
+
+While the cache is enabled, every channel created with `grpc.insecure_channel`
+or `grpc.secure_channel` goes through it, so clients that tests create
+directly are covered too.
+"""
+
+import functools
+import hashlib
+import os
+import sqlite3
+
+import grpc
+import pytest
+from google.protobuf import symbol_database
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "python-pachyderm-tests", "grpc-cache.sqlite")
+
+# methods whose names start with these prefixes don't change the cluster's
+# state, so their responses can be cached
+CACHEABLE_METHOD_PREFIXES = ("List", "Inspect", "Flush")
+# methods that don't change the cluster's state either, but aren't cached,
+# because their streams usually aren't read to completion
+UNCACHED_READ_ONLY_METHODS = ("GetLogs", "GetFile")
+
+_cache = None
+_channel_constructors = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--grpc-cache",
+        choices=("record", "replay", "off"),
+        default="off",
+        help="record or replay responses to read-only gRPC calls (default: off)",
+    )
+
+
+def pytest_configure(config):
+    global _cache
+    mode = config.getoption("--grpc-cache")
+    if mode == "off":
+        return
+    # the cluster's state when a test runs depends on what other workers have
+    # run so far, so responses recorded in parallel runs can't be replayed
+    if config.getoption("numprocesses", None):
+        raise pytest.UsageError("--grpc-cache can't be used with -n")
+    _cache = ResponseCache(CACHE_PATH, replay=mode == "replay")
+    for name in ("insecure_channel", "secure_channel"):
+        _channel_constructors[name] = getattr(grpc, name)
+        setattr(grpc, name, _intercepting(_channel_constructors[name]))
+
+
+def pytest_unconfigure(config):
+    global _cache
+    for name, constructor in _channel_constructors.items():
+        setattr(grpc, name, constructor)
+    _channel_constructors.clear()
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    if _cache is None:
+        yield
+        return
+    _cache.start_test(item.nodeid)
+    yield
+    _cache.stop_test()
+
+
+def is_enabled():
+    return _cache is not None
+
+
+def is_cacheable(method):
+    return method.rsplit("/", 1)[-1].startswith(CACHEABLE_METHOD_PREFIXES)
+
+
+def is_read_only(method):
+    return is_cacheable(method) or method.rsplit("/", 1)[-1] in UNCACHED_READ_ONLY_METHODS
+
+
+def _intercepting(channel_constructor):
+    @functools.wraps(channel_constructor)
+    def wrapper(*args, **kwargs):
+        return grpc.intercept_channel(channel_constructor(*args, **kwargs), CachingInterceptor(_cache))
+
+    return wrapper
+
+
+class ResponseCache:
+    """
+    Stores serialized responses in a SQLite database, keyed on a hash of the
+    test, method name and serialized request.
+    """
+
+    def __init__(self, path, replay):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # wait on writes from other test sessions rather than failing
+        # immediately
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS calls (key TEXT PRIMARY KEY, test TEXT, count INTEGER)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT, idx INTEGER, type TEXT, value BLOB, "
+            "PRIMARY KEY (key, idx))"
+        )
+        self._conn.commit()
+        self.replay = replay
+        self.test = None
+        # incremented whenever `test` changes, so that streams read after a
+        # test has stopped using the cache aren't stored
+        self.generation = 0
+
+    def start_test(self, test):
+        """
+        Starts caching calls for `test`. When recording, this first removes
+        any responses previously recorded for it, so they're replaced by this
+        run's.
+        """
+        if not self.replay:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM calls WHERE test = ?)", (test,)
+                )
+                self._conn.execute("DELETE FROM calls WHERE test = ?", (test,))
+        self.test = test
+        self.generation += 1
+
+    def stop_test(self):
+        """
+        Stops caching calls until the next test starts. Called when a test
+        finishes, or makes a call that writes to the cluster.
+        """
+        self.test = None
+        self.generation += 1
+
+    def close(self):
+        self._conn.close()
+
+    def key(self, method, request):
+        h = hashlib.sha256(self.test.encode("utf-8"))
+        h.update(b"\0")
+        h.update(method.encode("utf-8"))
+        h.update(b"\0")
+        h.update(request.SerializeToString(deterministic=True))
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the list of responses stored for `key`, or `None` if there
+        aren't any.
+        """
+        row = self._conn.execute("SELECT count FROM calls WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        rows = self._conn.execute("SELECT type, value FROM responses WHERE key = ? ORDER BY idx", (key,)).fetchall()
+        if len(rows) != row[0]:
+            return None
+        db = symbol_database.Default()
+        return [db.GetSymbol(type_name).FromString(value) for (type_name, value) in rows]
+
+    def put(self, key, responses):
+        if self.replay or self.test is None:
+            return
+        with self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calls (key, test, count) VALUES (?, ?, ?)", (key, self.test, len(responses))
+            )
+            self._conn.executemany(
+                "INSERT INTO responses (key, idx, type, value) VALUES (?, ?, ?, ?)",
+                [(key, i, r.DESCRIPTOR.full_name, r.SerializeToString()) for (i, r) in enumerate(responses)],
+            )
+
+
+class CachedResponse:
+    """
+    Stands in for the future returned by unary calls, for responses served
+    from the cache.
+    """
+
+    def __init__(self, response):
+        self._response = response
+
+    def result(self, timeout=None):
+        return self._response
+
+    def exception(self, timeout=None):
+        return None
+
+    def traceback(self, timeout=None):
+        return None
+
+    def code(self):
+        return grpc.StatusCode.OK
+
+    def details(self):
+        return None
+
+    def initial_metadata(self):
+        return ()
+
+    def trailing_metadata(self):
+        return ()
+
+
+class CachingInterceptor(
+    grpc.UnaryUnaryClientInterceptor,
+    grpc.UnaryStreamClientInterceptor,
+    grpc.StreamUnaryClientInterceptor,
+    grpc.StreamStreamClientInterceptor,
+):
+    def __init__(self, cache):
+        self._cache = cache
+
+    def _lookup(self, client_call_details, request):
+        method = client_call_details.method
+        if not is_read_only(method):
+            self._cache.stop_test()
+        if self._cache.test is None or not is_cacheable(method):
+            return (None, None)
+        key = self._cache.key(method, request)
+        return (key, self._cache.get(key) if self._cache.replay else None)
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        key, cached = self._lookup(client_call_details, request)
+        if cached is not None:
+            return CachedResponse(cached[0])
+
+        outcome = continuation(client_call_details, request)
+        if key is not None and outcome.exception() is None:
+            self._cache.put(key, [outcome.result()])
+        return outcome
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        key, cached = self._lookup(client_call_details, request)
+        if cached is not None:
+            return iter(cached)
+
+        responses = continuation(client_call_details, request)
+        if key is None or self._cache.replay:
+            return responses
+        return self._record_stream(key, self._cache.generation, responses)
+
+    def _record_stream(self, key, generation, responses):
+        # only store streams that were read to completion, so that partially
+        # read streams aren't replayed as if they were complete, and only if
+        # the test that started the stream hasn't since stopped using the
+        # cache
+        recorded = []
+        for response in responses:
+            recorded.append(response)
+            yield response
+        if self._cache.generation == generation:
+            self._cache.put(key, recorded)
+
+    def intercept_stream_unary(self, continuation, client_call_details, request_iterator):
+        # calls with streaming requests are all writes (e.g. `PutFile`)
+        self._cache.stop_test()
+        return continuation(client_call_details, request_iterator)
+
+    def intercept_stream_stream(self, continuation, client_call_details, request_iterator):
+        self._cache.stop_test()
+        return continuation(client_call_details, request_iterator)
@@ -7,6 +7,8 @@ import pytest
 import python_pachyderm
 from tests import util
 
+pytestmark = pytest.mark.serial
+
 
 def test_extract_restore():
     client = python_pachyderm.Client()
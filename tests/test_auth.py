@@ -10,6 +10,8 @@ import pytest
 import python_pachyderm
 from tests import util
 
+pytestmark = pytest.mark.serial
+
 
 @contextmanager
 def sandbox():
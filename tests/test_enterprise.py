@@ -9,6 +9,8 @@ import pytest
 import python_pachyderm
 from tests import util
 
+pytestmark = pytest.mark.serial
+
 
 @util.skip_if_no_enterprise()
 def test_enterprise():
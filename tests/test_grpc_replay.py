@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""Tests of the gRPC response cache used by tests. These don't need a cluster."""
+
+from collections import namedtuple
+
+import pytest
+
+from python_pachyderm.proto.pfs import pfs_pb2 as pfs_proto
+from tests import grpc_replay
+
+CallDetails = namedtuple("CallDetails", ["method"])
+
+INSPECT_REPO = CallDetails("/pfs.API/InspectRepo")
+LIST_COMMIT = CallDetails("/pfs.API/ListCommitStream")
+GET_FILE = CallDetails("/pfs.API/GetFile")
+DELETE_REPO = CallDetails("/pfs.API/DeleteRepo")
+PUT_FILE = CallDetails("/pfs.API/PutFile")
+
+
+class FailedCall:
+    def exception(self):
+        return Exception()
+
+    def result(self):
+        raise Exception()
+
+
+def repo_request(name):
+    return pfs_proto.InspectRepoRequest(repo=pfs_proto.Repo(name=name))
+
+def repo_info(name):
+    return pfs_proto.RepoInfo(repo=pfs_proto.Repo(name=name))
+
+def commit_infos(*ids):
+    return [pfs_proto.CommitInfo(commit=pfs_proto.Commit(id=i)) for i in ids]
+
+def respond_with(response):
+    return lambda details, request: grpc_replay.CachedResponse(response)
+
+def fail(details, request):
+    raise AssertionError("unexpected call to the cluster")
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "grpc-cache.sqlite")
+
+def record(cache_path, test, calls):
+    """
+    Runs `calls`, a function taking an interceptor, as `test` with the cache
+    in record mode.
+    """
+    cache = grpc_replay.ResponseCache(cache_path, replay=False)
+    try:
+        cache.start_test(test)
+        calls(grpc_replay.CachingInterceptor(cache))
+        cache.stop_test()
+    finally:
+        cache.close()
+
+@pytest.fixture
+def replay(cache_path):
+    cache = grpc_replay.ResponseCache(cache_path, replay=True)
+    yield cache
+    cache.close()
+
+def test_is_read_only():
+    assert grpc_replay.is_cacheable(INSPECT_REPO.method)
+    assert grpc_replay.is_read_only(GET_FILE.method)
+    assert not grpc_replay.is_cacheable(GET_FILE.method)
+    assert not grpc_replay.is_read_only(DELETE_REPO.method)
+
+def test_replay_unary(cache_path, replay):
+    record(cache_path, "t", lambda i: i.intercept_unary_unary(respond_with(repo_info("foo")), INSPECT_REPO, repo_request("foo")))
+
+    replay.start_test("t")
+    interceptor = grpc_replay.CachingInterceptor(replay)
+    assert interceptor.intercept_unary_unary(fail, INSPECT_REPO, repo_request("foo")).result() == repo_info("foo")
+    # different requests, and the same request from other tests, aren't
+    # served from the cache
+    assert interceptor.intercept_unary_unary(respond_with(repo_info("bar")), INSPECT_REPO, repo_request("bar")).result() == repo_info("bar")
+    replay.start_test("u")
+    assert interceptor.intercept_unary_unary(respond_with(repo_info("baz")), INSPECT_REPO, repo_request("foo")).result() == repo_info("baz")
+
+def test_replay_stream(cache_path, replay):
+    record(cache_path, "t", lambda i: list(i.intercept_unary_stream(lambda d, r: iter(commit_infos("a", "b")), LIST_COMMIT, repo_request("foo"))))
+
+    replay.start_test("t")
+    interceptor = grpc_replay.CachingInterceptor(replay)
+    assert list(interceptor.intercept_unary_stream(fail, LIST_COMMIT, repo_request("foo"))) == commit_infos("a", "b")
+
+def test_replay_doesnt_store(replay):
+    replay.start_test("t")
+    interceptor = grpc_replay.CachingInterceptor(replay)
+    interceptor.intercept_unary_unary(respond_with(repo_info("foo")), INSPECT_REPO, repo_request("foo"))
+    assert replay.get(replay.key(INSPECT_REPO.method, repo_request("foo"))) is None
+
+def test_failed_calls_arent_stored(cache_path, replay):
+    record(cache_path, "t", lambda i: i.intercept_unary_unary(lambda d, r: FailedCall(), INSPECT_REPO, repo_request("foo")))
+
+    replay.start_test("t")
+    assert replay.get(replay.key(INSPECT_REPO.method, repo_request("foo"))) is None
+
+def test_partially_read_streams_arent_stored(cache_path, replay):
+    record(cache_path, "t", lambda i: next(i.intercept_unary_stream(lambda d, r: iter(commit_infos("a", "b")), LIST_COMMIT, repo_request("foo"))))
+
+    replay.start_test("t")
+    assert replay.get(replay.key(LIST_COMMIT.method, repo_request("foo"))) is None
+
+@pytest.mark.parametrize("write", [
+    lambda i: i.intercept_unary_unary(respond_with(pfs_proto.Repo()), DELETE_REPO, repo_request("foo")),
+    lambda i: i.intercept_stream_unary(lambda d, r: None, PUT_FILE, iter([])),
+])
+def test_writes_stop_caching(cache_path, replay, write):
+    def calls(interceptor):
+        stream = interceptor.intercept_unary_stream(lambda d, r: iter(commit_infos("a")), LIST_COMMIT, repo_request("foo"))
+        write(interceptor)
+        # neither streams finished after the write, nor reads made after
+        # it, are stored
+        list(stream)
+        interceptor.intercept_unary_unary(respond_with(repo_info("foo")), INSPECT_REPO, repo_request("foo"))
+
+    record(cache_path, "t", calls)
+
+    replay.start_test("t")
+    assert replay.get(replay.key(LIST_COMMIT.method, repo_request("foo"))) is None
+    assert replay.get(replay.key(INSPECT_REPO.method, repo_request("foo"))) is None
+
+def test_uncached_read_only_calls_dont_stop_caching(cache_path, replay):
+    def calls(interceptor):
+        interceptor.intercept_unary_stream(lambda d, r: iter([]), GET_FILE, repo_request("foo"))
+        interceptor.intercept_unary_unary(respond_with(repo_info("foo")), INSPECT_REPO, repo_request("foo"))
+
+    record(cache_path, "t", calls)
+
+    replay.start_test("t")
+    assert replay.get(replay.key(GET_FILE.method, repo_request("foo"))) is None
+    assert replay.get(replay.key(INSPECT_REPO.method, repo_request("foo"))) == [repo_info("foo")]
+
+def test_calls_outside_tests_arent_cached(cache_path):
+    cache = grpc_replay.ResponseCache(cache_path, replay=False)
+    interceptor = grpc_replay.CachingInterceptor(cache)
+    interceptor.intercept_unary_unary(respond_with(repo_info("foo")), INSPECT_REPO, repo_request("foo"))
+    count = cache._conn.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+    cache.close()
+    assert count == 0
+
+def test_record_replaces_previous_responses(cache_path, replay):
+    record(cache_path, "t", lambda i: i.intercept_unary_unary(respond_with(repo_info("foo")), INSPECT_REPO, repo_request("foo")))
+    record(cache_path, "t", lambda i: i.intercept_unary_unary(respond_with(repo_info("bar")), INSPECT_REPO, repo_request("bar")))
+
+    replay.start_test("t")
+    assert replay.get(replay.key(INSPECT_REPO.method, repo_request("foo"))) is None
+    assert replay.get(replay.key(INSPECT_REPO.method, repo_request("bar"))) == [repo_info("bar")]
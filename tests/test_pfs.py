@@ -24,6 +24,7 @@ def test_inspect_repo():
     assert repo_name in [r.repo.name for r in repos]
 
 
+@pytest.mark.serial
 def test_delete_repo():
     client, repo_name = sandbox("delete_repo")
     orig_repo_count = len(client.list_repo())
@@ -32,6 +33,7 @@ def test_delete_repo():
     assert len(client.list_repo()) == orig_repo_count - 1
 
 
+@pytest.mark.serial
 def test_delete_non_existent_repo():
     client = python_pachyderm.Client()
     orig_repo_count = len(client.list_repo())
@@ -39,6 +41,7 @@ def test_delete_non_existent_repo():
     assert len(client.list_repo()) == orig_repo_count
 
 
+@pytest.mark.serial
 def test_delete_all_repos():
     client = python_pachyderm.Client()
 
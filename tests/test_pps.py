@@ -2,153 +2,116 @@
 
 """Tests for PPS-related functionality."""
 
-import time
-
 import pytest
 import grpc
 
 import python_pachyderm
 from tests import util
 
-class Sandbox:
-    def __init__(self, test_name):
-        client = python_pachyderm.Client()
-        commit, input_repo_name, pipeline_repo_name = util.create_test_pipeline(client, test_name)
-        self.client = client
-        self.commit = commit
-        self.input_repo_name = input_repo_name
-        self.pipeline_repo_name = pipeline_repo_name
-
-    def wait_for_job(self):
-        return util.wait_for_job(self.client, self.commit)
-
-def test_list_job():
-    sandbox = Sandbox("list_job")
+def test_list_job(sandbox):
     job_id = sandbox.wait_for_job()
 
-    jobs = list(sandbox.client.list_job())
-    assert len(jobs) >= 1
-
-    jobs = list(sandbox.client.list_job(pipeline_name=sandbox.pipeline_repo_name))
-    assert len(jobs) >= 1
-
+    # filter on the input commit server-side, then check the rest of the
+    # job's details client-side rather than with more filtered calls
     jobs = list(sandbox.client.list_job(input_commit=(sandbox.input_repo_name, sandbox.commit.id)))
-    assert len(jobs) >= 1
+    assert any(j.job.id == job_id and j.pipeline.name == sandbox.pipeline_repo_name for j in jobs)
 
-def test_flush_job():
-    sandbox = Sandbox("flush_job")
-    jobs = list(sandbox.client.flush_job([sandbox.commit]))
+def test_flush_job(sandbox):
+    # the input commit is shared by every sandbox's pipeline, so only flush
+    # this sandbox's
+    jobs = list(sandbox.client.flush_job([sandbox.commit], pipeline_names=[sandbox.pipeline_repo_name]))
     assert len(jobs) >= 1
-    print(jobs[0])
 
-def test_inspect_job():
-    sandbox = Sandbox("inspect_job")
+def test_inspect_job(sandbox):
     job_id = sandbox.wait_for_job()
 
     job = sandbox.client.inspect_job(job_id)
     assert job.job.id == job_id
 
-def test_stop_job():
-    sandbox = Sandbox("stop_job")
-    job_id = sandbox.wait_for_job()
+def test_stop_job(private_sandbox):
+    # don't use `wait_for_job`, which waits for the job to finish
+    job_id = private_sandbox.wait_for_job_start()
 
-    # This may fail if the job finished between the last call and here, so
-    # ignore _Rendezvous errors.
+    # This may fail if the job already finished, so ignore the errors pachd
+    # returns for that. Anything else (e.g. the cluster being unavailable) is
+    # a real failure. Note that pachd reports most errors as `UNKNOWN`.
     try:
-        sandbox.client.stop_job(job_id)
-    except:
+        private_sandbox.client.stop_job(job_id)
+    except grpc.RpcError as e:
+        if e.code() not in (grpc.StatusCode.FAILED_PRECONDITION, grpc.StatusCode.NOT_FOUND, grpc.StatusCode.UNKNOWN):
+            raise
         # if it failed, it should be because the job already finished
-        job = sandbox.client.inspect_job(job_id)
+        job = private_sandbox.client.inspect_job(job_id)
         assert job.state == python_pachyderm.JobState.JOB_SUCCESS.value
     else:
-        # This is necessary because `StopJob` does not wait for the job to be
-        # killed before returning a result.
-        # TODO: remove once this is fixed:
-        # https://github.com/pachyderm/pachyderm/issues/3856
-        time.sleep(1)
-        job = sandbox.client.inspect_job(job_id)
+        # `StopJob` does not wait for the job to be killed before returning a
+        # result (https://github.com/pachyderm/pachyderm/issues/3856), so
+        # block until the job reaches a terminal state
+        job = private_sandbox.client.inspect_job(job_id, block_state=True)
         assert job.state == python_pachyderm.JobState.JOB_KILLED.value
 
-def test_delete_job():
-    sandbox = Sandbox("delete_job")
-    job_id = sandbox.wait_for_job()
-    orig_job_count = len(list(sandbox.client.list_job()))
-    sandbox.client.delete_job(job_id)
-    assert len(list(sandbox.client.list_job())) == orig_job_count - 1
+@pytest.mark.serial
+def test_delete_job(private_sandbox, baseline_job_count):
+    job_id = private_sandbox.wait_for_job()
+    private_sandbox.client.delete_job(job_id)
+    assert len(list(private_sandbox.client.list_job())) == baseline_job_count - 1
 
-def test_datums():
-    sandbox = Sandbox("datums")
+def test_datums(sandbox):
     job_id = sandbox.wait_for_job()
 
-    # flush the job so it fully finishes
-    list(sandbox.client.flush_commit([(sandbox.input_repo_name, sandbox.commit.id)]))
-
     datums = list(sandbox.client.list_datum(job_id))
     assert len(datums) == 1
     datum = sandbox.client.inspect_datum(job_id, datums[0].datum_info.datum.id)
     assert datum.state == python_pachyderm.DatumState.SUCCESS.value
 
-    # Skip this check in >=1.11.0, due to a bug:
-    # https://github.com/pachyderm/pachyderm/issues/5123
-    # TODO: remove this check once the bug is fixed
-    if util.test_pachyderm_version() < (1, 11, 0):
-        # Just ensure this doesn't raise an exception
-        sandbox.client.restart_datum(job_id)
+# Skip this in >=1.11.0, due to a bug:
+# https://github.com/pachyderm/pachyderm/issues/5123
+# TODO: remove this skip once the bug is fixed
+@pytest.mark.skipif(util.test_pachyderm_version() >= (1, 11, 0), reason="restart_datum is broken in pachyderm 1.11")
+def test_restart_datum(private_sandbox):
+    job_id = private_sandbox.wait_for_job()
+    # Just ensure this doesn't raise an exception
+    private_sandbox.client.restart_datum(job_id)
 
-def test_inspect_pipeline():
-    sandbox = Sandbox("inspect_pipeline")
+def test_inspect_pipeline(sandbox):
     pipeline = sandbox.client.inspect_pipeline(sandbox.pipeline_repo_name)
     assert pipeline.pipeline.name == sandbox.pipeline_repo_name
     if util.test_pachyderm_version() >= (1, 9, 0):
         pipeline = sandbox.client.inspect_pipeline(sandbox.pipeline_repo_name, history=-1)
         assert pipeline.pipeline.name == sandbox.pipeline_repo_name
 
-def test_list_pipeline():
-    sandbox = Sandbox("list_pipeline")
-    pipelines = sandbox.client.list_pipeline()
-    assert sandbox.pipeline_repo_name in [p.pipeline.name for p in pipelines.pipeline_info]
+def test_list_pipeline(sandbox):
+    # pipelines listed with `history=-1` include the current version, so this
+    # also covers listing without history
     pipelines = sandbox.client.list_pipeline(history=-1)
     assert sandbox.pipeline_repo_name in [p.pipeline.name for p in pipelines.pipeline_info]
 
-def test_delete_pipeline():
-    sandbox = Sandbox("delete_pipeline")
-    orig_pipeline_count = len(sandbox.client.list_pipeline().pipeline_info)
-    sandbox.client.delete_pipeline(sandbox.pipeline_repo_name)
-    assert len(sandbox.client.list_pipeline().pipeline_info) == orig_pipeline_count - 1
-
-def test_delete_all_pipelines():
-    sandbox = Sandbox("delete_all_pipelines")
-    sandbox.client.delete_all_pipelines()
-    pipelines = sandbox.client.list_pipeline()
-    assert len(pipelines.pipeline_info) == 0
+@pytest.mark.serial
+def test_delete_pipeline(private_sandbox, baseline_pipeline_count):
+    private_sandbox.client.delete_pipeline(private_sandbox.pipeline_repo_name)
+    assert len(private_sandbox.client.list_pipeline().pipeline_info) == baseline_pipeline_count - 1
 
-def test_restart_pipeline():
-    sandbox = Sandbox("restart_job")
-
-    sandbox.client.stop_pipeline(sandbox.pipeline_repo_name)
-    pipeline = sandbox.client.inspect_pipeline(sandbox.pipeline_repo_name)
+def test_restart_pipeline(private_sandbox):
+    private_sandbox.client.stop_pipeline(private_sandbox.pipeline_repo_name)
+    pipeline = private_sandbox.client.inspect_pipeline(private_sandbox.pipeline_repo_name)
     assert pipeline.stopped
 
-    sandbox.client.start_pipeline(sandbox.pipeline_repo_name)
-    pipeline = sandbox.client.inspect_pipeline(sandbox.pipeline_repo_name)
+    private_sandbox.client.start_pipeline(private_sandbox.pipeline_repo_name)
+    pipeline = private_sandbox.client.inspect_pipeline(private_sandbox.pipeline_repo_name)
     assert not pipeline.stopped
 
 @util.skip_if_below_pachyderm_version(1, 9, 0)
-def test_run_pipeline():
-    sandbox = Sandbox("run_pipeline")
-
-    # flush the job so it fully finishes
-    list(sandbox.client.flush_commit([(sandbox.input_repo_name, sandbox.commit.id)]))
+def test_run_pipeline(private_sandbox):
+    # wait for the job so it fully finishes
+    private_sandbox.wait_for_job()
 
     # just make sure it worked
-    sandbox.client.run_pipeline(sandbox.pipeline_repo_name)
+    private_sandbox.client.run_pipeline(private_sandbox.pipeline_repo_name)
 
 @util.skip_if_below_pachyderm_version(1, 9, 10)
-def test_run_cron():
-    sandbox = Sandbox("run_cron")
-
-    # flush the job so it fully finishes
-    list(sandbox.client.flush_commit([(sandbox.input_repo_name, sandbox.commit.id)]))
+def test_run_cron(sandbox):
+    # wait for the job so it fully finishes
+    sandbox.wait_for_job()
 
     # this should trigger an error because the sandbox pipeline doesn't have a
     # cron input
@@ -157,6 +120,7 @@ def test_run_cron():
         sandbox.client.run_cron(sandbox.pipeline_repo_name)
     assert "pipeline must have a cron input" in str(e.value)
 
+@pytest.mark.serial
 @util.skip_if_below_pachyderm_version(1, 10, 0)
 def test_secrets():
     client = python_pachyderm.Client()
@@ -181,30 +145,24 @@ def test_secrets():
     secrets = client.list_secret()
     assert len(secrets) == 0
 
-def test_get_pipeline_logs():
-    sandbox = Sandbox("get_pipeline_logs")
+def test_get_pipeline_logs(sandbox):
     job_id = sandbox.wait_for_job()
 
-    # Wait for the job to complete
-    list(sandbox.client.flush_job([sandbox.commit]))
-
-    # Just make sure these spit out some logs
-    logs = sandbox.client.get_pipeline_logs(sandbox.pipeline_repo_name)
-    assert next(logs) is not None
-
-    logs = sandbox.client.get_pipeline_logs(sandbox.pipeline_repo_name, master=True)
-    assert next(logs) is not None
+    # Just make sure these spit out some logs. Worker and master logs are
+    # distinct, so both are needed, but streaming calls start as soon as
+    # they're made -- so start both before reading either, letting their
+    # round trips overlap.
+    worker_logs = sandbox.client.get_pipeline_logs(sandbox.pipeline_repo_name)
+    master_logs = sandbox.client.get_pipeline_logs(sandbox.pipeline_repo_name, master=True)
+    assert next(worker_logs) is not None
+    assert next(master_logs) is not None
 
 # job logs are available in 1.8.x, but they frequently fail due to bugs that
 # are resolved in 1.9.0
 @util.skip_if_below_pachyderm_version(1, 9, 0)
-def test_get_job_logs():
-    sandbox = Sandbox("get_logs_logs")
+def test_get_job_logs(sandbox):
     job_id = sandbox.wait_for_job()
 
-    # Wait for the job to complete
-    list(sandbox.client.flush_job([sandbox.commit]))
-
     # Just make sure these spit out some logs
     logs = sandbox.client.get_job_logs(job_id)
     assert next(logs) is not None
@@ -232,3 +190,11 @@ def test_create_pipeline_from_request():
     ))
 
     assert any(p.pipeline.name == pipeline_name for p in client.list_pipeline().pipeline_info)
+
+# NOTE: this deletes every pipeline, including the one in the module-wide
+# sandbox, so it needs to be the last test in the module
+@pytest.mark.serial
+def test_delete_all_pipelines(private_sandbox):
+    private_sandbox.client.delete_all_pipelines()
+    pipelines = private_sandbox.client.list_pipeline()
+    assert len(pipelines.pipeline_info) == 0
@@ -2,12 +2,30 @@
 
 """Tests of spout managers."""
 
+import io
+import tarfile
 import tempfile
+from os.path import join
 
 import pytest
 import python_pachyderm
 
 
+def _read_tar(path, offset=0):
+    # read members in a single forward pass with `next()`, rather than
+    # looking each one up by name, which also checks that they were written
+    # in order
+    with open(path, "rb") as f:
+        f.seek(offset)
+        buf = f.read()
+    members = []
+    with tarfile.open(fileobj=io.BytesIO(buf), mode="r|") as t:
+        member = t.next()
+        while member is not None:
+            members.append((member.name, t.extractfile(member).read()))
+            member = t.next()
+    return members
+
 def test_spout_manager():
     with tempfile.TemporaryDirectory(suffix="pachyderm") as d:
         manager = python_pachyderm.SpoutManager(pfs_directory=d, marker_filename="marker")
@@ -15,9 +33,16 @@ def test_spout_manager():
         with manager.commit() as commit:
             commit.put_file_from_bytes("foo1.txt", b"bar1")
             commit.put_marker_from_bytes(b"marker1")
+        manager._pipe.flush()
+        assert _read_tar(join(d, "out")) == [("foo1.txt", b"bar1"), ("marker", b"marker1")]
+
+        # each commit is written as its own archive after the previous one
+        offset = manager._pipe.tell()
         with manager.commit() as commit:
             commit.put_file_from_bytes("foo2.txt", b"bar2")
             commit.put_marker_from_bytes(b"marker2")
+        manager._pipe.flush()
+        assert _read_tar(join(d, "out"), offset=offset) == [("foo2.txt", b"bar2"), ("marker", b"marker2")]
 
 def test_spout_manager_nested_commits():
     with tempfile.TemporaryDirectory(suffix="pachyderm") as d:
@@ -37,6 +62,12 @@ def test_spout_manager_commit_state():
 
         with pytest.raises(Exception):
             with manager.commit() as commit:
+                commit.put_file_from_bytes("partial.txt", b"partial")
                 raise Exception()
 
+        # a failed commit is left open, so the manager refuses further
+        # commits rather than writing them after the partial one
         assert manager._has_open_commit
+        with pytest.raises(Exception, match="already opened"):
+            with manager.commit():
+                pass
@@ -7,6 +7,8 @@ import pytest
 import python_pachyderm
 from tests import util
 
+pytestmark = pytest.mark.serial
+
 
 @util.skip_if_below_pachyderm_version(1, 9, 10)
 def test_batch_transaction():
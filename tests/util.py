@@ -3,11 +3,14 @@ import time
 import string
 import random
 
+import grpc
 import pytest
 import python_pachyderm
 
 _test_pachyderm_version = None
 
+_RANDOM_STRING_ALPHABET = string.ascii_lowercase + string.digits
+
 def test_pachyderm_version():
     global _test_pachyderm_version
 
@@ -33,7 +36,7 @@ def skip_if_no_enterprise():
     return pytest.mark.skipif(test, reason="enterprise code not available")
 
 def random_string(n):
-    return "".join(random.choice(string.ascii_lowercase + string.digits) for _ in range(n))
+    return "".join(random.choice(_RANDOM_STRING_ALPHABET) for _ in range(n))
 
 def test_repo_name(test_name, prefix=None, suffix=None):
     prefix = "" if prefix is None else "{}-".format(prefix)
@@ -45,10 +48,53 @@ def create_test_repo(client, test_name, prefix=None, suffix=None):
     client.create_repo(repo_name, "python_pachyderm test repo for {}".format(test_name))
     return repo_name
 
-def create_test_pipeline(client, test_name):
-    repo_name_suffix = random_string(6)
-    input_repo_name = create_test_repo(client, test_name, prefix="input", suffix=repo_name_suffix)
-    pipeline_repo_name = test_repo_name(test_name, prefix="pipeline", suffix=repo_name_suffix)
+_TEST_INPUT_DATA = b'DATA'
+
+def create_test_input_commit(client, input_repo_name):
+    with client.commit(input_repo_name, 'master') as commit:
+        client.put_file_bytes(commit, 'file.dat', _TEST_INPUT_DATA)
+    return commit
+
+def is_test_input_commit(client, commit_info):
+    """
+    Returns whether `commit_info` is for a finished commit containing the
+    test input's `file.dat`.
+    """
+    if commit_info.finished.seconds == 0:
+        return False
+    try:
+        file_info = client.inspect_file(commit_info.commit, 'file.dat')
+    except grpc.RpcError as e:
+        # pachd reports a missing file as `UNKNOWN`
+        if e.code() not in (grpc.StatusCode.NOT_FOUND, grpc.StatusCode.UNKNOWN):
+            raise
+        return False
+    return file_info.size_bytes == len(_TEST_INPUT_DATA)
+
+def get_or_create_test_input(client, input_repo_name):
+    # the input is always the same, so if a previous run already created it,
+    # reuse that run's commit
+    try:
+        commit_info = client.inspect_commit((input_repo_name, 'master'))
+    except grpc.RpcError as e:
+        # pachd reports a missing repo or branch as `UNKNOWN`
+        if e.code() not in (grpc.StatusCode.NOT_FOUND, grpc.StatusCode.UNKNOWN):
+            raise
+        client.create_repo(input_repo_name, "python_pachyderm shared test input repo", update=True)
+        return create_test_input_commit(client, input_repo_name)
+
+    if is_test_input_commit(client, commit_info):
+        return commit_info.commit
+
+    # a previous run was interrupted while creating the input. If it never
+    # finished its commit, delete it, so that jobs don't wait on it forever.
+    # Either way, make a fresh commit with the input.
+    if commit_info.finished.seconds == 0:
+        client.delete_commit(commit_info.commit)
+    return create_test_input_commit(client, input_repo_name)
+
+def create_test_pipeline_from_input(client, test_name, input_repo_name, suffix=None):
+    pipeline_repo_name = test_repo_name(test_name, prefix="pipeline", suffix=suffix)
 
     client.create_pipeline(
         pipeline_repo_name,
@@ -57,24 +103,52 @@ def create_test_pipeline(client, test_name):
         enable_stats=True,
     )
 
-    with client.commit(input_repo_name, 'master') as commit:
-        client.put_file_bytes(commit, 'file.dat', b'DATA')
+    return pipeline_repo_name
+
+def get_or_create_test_pipeline_from_input(client, test_name, input_repo_name):
+    # the pipeline's name doesn't have a random suffix, so if a previous run
+    # already created it, reuse it
+    pipeline_repo_name = test_repo_name(test_name, prefix="pipeline", suffix="shared")
+    try:
+        client.inspect_pipeline(pipeline_repo_name)
+        return pipeline_repo_name
+    except grpc.RpcError as e:
+        # pachd reports a missing pipeline as `UNKNOWN`
+        if e.code() not in (grpc.StatusCode.NOT_FOUND, grpc.StatusCode.UNKNOWN):
+            raise
+    return create_test_pipeline_from_input(client, test_name, input_repo_name, suffix="shared")
 
+def create_test_pipeline(client, test_name):
+    repo_name_suffix = random_string(6)
+    input_repo_name = create_test_repo(client, test_name, prefix="input", suffix=repo_name_suffix)
+    pipeline_repo_name = create_test_pipeline_from_input(client, test_name, input_repo_name, suffix=repo_name_suffix)
+    commit = create_test_input_commit(client, input_repo_name)
     return (commit, input_repo_name, pipeline_repo_name)
 
-def wait_for_job(client, commit):
+def wait_for_job(client, commit, pipeline_name=None):
+    # block until the commit is finished, so its job is guaranteed to exist
+    client.inspect_commit(commit, block_state=python_pachyderm.CommitState.FINISHED.value)
+
+    # flush the commit's job, which blocks until the job is done and returns
+    # its info in a single streaming call. If the commit is the input to
+    # several pipelines, only flush the given one's job.
+    pipeline_names = [pipeline_name] if pipeline_name is not None else None
+    return next(iter(client.flush_job([commit], pipeline_names=pipeline_names)))
+
+def wait_for_job_start(client, commit, pipeline_name):
     # block until the commit is ready
     client.inspect_commit(commit, block_state=python_pachyderm.CommitState.READY.value)
 
     # while the commit is ready, the job might not be listed on the first
-    # call, so repeatedly list jobs until it's available
+    # call, so repeatedly list the pipeline's jobs until it's available. This
+    # doesn't wait for the job to finish, unlike `wait_for_job`.
     start_time = time.time()
     while True:
-        for job in client.list_job():
+        for job in client.list_job(pipeline_name=pipeline_name):
             return job.job.id
 
         assert time.time() - start_time < 60.0, "timed out waiting for job"
-        time.sleep(1)
+        time.sleep(0.1)
 
 def get_cluster_deployment_id():
     client = python_pachyderm.Client()